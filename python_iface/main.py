@@ -1,17 +1,16 @@
+import re
 import sys
+from collections import deque
+from functools import lru_cache
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout,
     QHBoxLayout, QPushButton, QLabel, QTextEdit, QLineEdit, QComboBox
 )
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
-from PyQt5.QtGui import QFont
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.figure import Figure
+from PyQt5.QtCore import QTimer, QThread, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtSerialPort import QSerialPort, QSerialPortInfo
 import numpy as np
-import serial
-import serial.tools.list_ports
-from scipy.signal import firwin, freqz
+import pyqtgraph as pg
 
 
 """
@@ -23,48 +22,148 @@ Commands:
 Commands must be sent with enter
 """
 
+# Number of filter coefficient registers
+NUM_REGS = 64
 
-class SerialReaderThread(QThread):
-    """Thread for reading from serial port"""
-    data_received = pyqtSignal(str)
+# FIR design: sample rate of the codec, one tap per register, Q1.15 coefficients
+FS = 48000.0
+TAPS = NUM_REGS
+NYQ = FS / 2.0
+INV_NYQ = 1.0 / NYQ
+SCALE_Q15 = 2**15
 
-    def __init__(self, serial_port):
+# Filter types needing an odd tap count for SciPy / two cutoff frequencies
+HP_BS = frozenset(("hp", "bs"))
+BP_BS = frozenset(("bp", "bs"))
+
+# Register addresses, x axis of the register plot
+_ADDR_X = np.arange(NUM_REGS, dtype=np.int32)
+
+# Commands awaiting a response at most. The firmware answers every command
+# with ~30 bytes and drops output once its 512 byte TX ring is full.
+MAX_IN_FLIGHT = 8
+
+# Read commands for all registers
+_READ_CMDS = [f"R{a}\n".encode('ascii') for a in range(NUM_REGS)]
+
+# Prefixes of the set commands for all coefficients: S<addr>$
+_SET_PREFIXES = [f"S{a}$".encode('ascii') for a in range(TAPS)]
+
+# Response of a read command: "Read reg[addr] = value", matched against the
+# whole line so truncated responses are not taken as valid
+_READ_RE = re.compile(r'Read reg\[(\d+)\]\s*=\s*(-?\d+)')
+
+# Echo of a read command sent during the read sweep
+_READ_ECHO_RE = re.compile(r'R\d+')
+
+# Echo of a set command sent while writing coefficients
+_SET_ECHO_RE = re.compile(r'S\d+\$-?\d+')
+
+# Acknowledgement of a set command: "Set reg[addr] = value"
+_SET_RE = re.compile(r'Set reg\[(\d+)\]\s*=\s*(-?\d+)')
+
+
+@lru_cache(maxsize=32)
+def _cached_firwin(numtaps, cutoff, pass_zero):
+    """firwin() for a tuple of normalized cutoffs, cached for repeated designs"""
+    # SciPy is only imported when coefficients are actually designed
+    from scipy.signal import firwin
+
+    coeff = firwin(numtaps, list(cutoff), pass_zero=pass_zero)
+    # Shared between calls, must not be modified
+    coeff.setflags(write=False)
+    return coeff
+
+
+class FirDesignWorker(QThread):
+    """Thread for designing the FIR filter and building the set commands"""
+    designed = pyqtSignal(bytes)
+    failed = pyqtSignal(str)
+
+    def __init__(self, cutoffs, ftype, quant_buf, fixed_buf):
         super().__init__()
-        self.serial_port = serial_port
-        self.running = True
+        self.cutoffs = cutoffs
+        self.ftype = ftype
+        self.quant_buf = quant_buf  # Scratch buffer for Q1.15 scaling, TAPS entries
+        self.fixed_buf = fixed_buf  # Output buffer for the int16 coefficients, TAPS entries
 
     def run(self):
-        """Continuously read from serial port"""
-        while self.running and self.serial_port and self.serial_port.is_open:
-            try:
-                if self.serial_port.in_waiting > 0:
-                    data = self.serial_port.read(self.serial_port.in_waiting)
-                    text = data.decode('utf-8', errors='ignore')
-                    self.data_received.emit(text)
-            except Exception as e:
-                self.data_received.emit(f"Error reading: {str(e)}")
-                break
-            self.msleep(10)  # Small delay to prevent CPU overuse
-
-    def stop(self):
-        """Stop the thread"""
-        self.running = False
+        """Design the filter and emit the set commands for all coefficients"""
+        try:
+            fixed = self.design()
+            payload = b"".join(prefix + b"%d\n" % val for prefix, val in zip(_SET_PREFIXES, fixed.tolist()))
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.designed.emit(payload)
+
+    def design(self):
+        """Design the filter and return its Q1.15 coefficients"""
+        c = self.cutoffs
+        ftype = self.ftype
+
+        # ---- FIR design with odd-tap fix for hp / bs ----
+        internal_taps = TAPS
+        if ftype in HP_BS and (TAPS % 2 == 0):
+            internal_taps = TAPS + 1  # make it odd for SciPy
+
+        # Normalize cutoffs
+        if ftype not in BP_BS:  # lp / hp
+            norm = c[0] * INV_NYQ
+            # keep strictly inside (0,1)
+            norm = max(1e-6, min(norm, 0.999999))
+            coeff = _cached_firwin(internal_taps, (norm,), ftype == "lp")
+
+        else:  # bp / bs
+            norm = [f * INV_NYQ for f in c]
+            norm = [max(1e-6, min(v, 0.999999)) for v in norm]
+            coeff = _cached_firwin(internal_taps, tuple(norm), ftype == "bs")
+
+        # Scale to Q1.15, trimming back to 64 taps (without the center tap)
+        # if we increased it
+        if internal_taps != TAPS:
+            center = internal_taps // 2
+            np.multiply(coeff[:center], SCALE_Q15, out=self.quant_buf[:center])
+            np.multiply(coeff[center + 1:], SCALE_Q15, out=self.quant_buf[center:])
+        else:
+            np.multiply(coeff, SCALE_Q15, out=self.quant_buf)
+        np.rint(self.quant_buf, out=self.quant_buf)
+        np.clip(self.quant_buf, -32768, 32767, out=self.quant_buf)
+        np.copyto(self.fixed_buf, self.quant_buf, casting='unsafe')
+        return self.fixed_buf
 
 
 class BasicQtApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.serial_port = None
-        self.reader_thread = None
-        self.read_values = []  # Store read values
-        self.current_address = 0  # Track current address being read
-        self.waiting_for_response = False  # Flag to track if waiting for response
+        self.read_values = np.zeros(NUM_REGS, dtype=np.int16)  # Store read values (signed 16-bit) by address
+        self.read_pending = np.zeros(NUM_REGS, dtype=bool)  # Addresses still waiting for a response
+        self.remaining = 0  # Number of addresses still waiting for a response
+        self.read_queue = deque()  # Addresses whose read command is not sent yet
+        self.reads_in_flight = 0  # Read commands sent but not answered yet
         self.reading_mode = False  # Flag to indicate we're in reading mode
-        self.response_buffer = ""  # Buffer to accumulate serial data
-        self.response_timeout_timer = None  # Timer for response timeout
-        self.max_retries = 3  # Maximum retry attempts per address
+        # Timer for response timeout, restarted whenever a response arrives
+        self.response_timeout_timer = QTimer(self)
+        self.response_timeout_timer.setSingleShot(True)
+        self.response_timeout_timer.timeout.connect(self.handle_response_timeout)
+        self.max_retries = 3  # Maximum retry attempts without any response
         self.retry_count = 0  # Current retry count
+        self.quant_buf = np.empty(TAPS, dtype=np.float64)  # Scratch buffer for Q1.15 scaling
+        self.fixed_buf = np.empty(TAPS, dtype=np.int16)  # Quantized coefficients
+        self.read_curve = None  # Persistent curve of the register plot
+        self.read_plot_values = None  # Copy of the values shown by read_curve
+        self.design_worker = None  # Running FIR design, only one at a time
+        self.writing_mode = False  # Flag to indicate coefficients are being written
+        self.write_queue = deque()  # Set commands not sent yet
+        self.writes_in_flight = 0  # Set commands sent but not acknowledged yet
+        # Timer for acknowledgement timeout, restarted whenever one arrives
+        self.write_timeout_timer = QTimer(self)
+        self.write_timeout_timer.setSingleShot(True)
+        self.write_timeout_timer.timeout.connect(self.handle_write_timeout)
+        self.verbose = False  # Echo every written set command to the console
         self.init_ui()
+        self.setup_read_plot()
 
     def init_ui(self):
         """Initialize the user interface"""
@@ -76,13 +175,13 @@ class BasicQtApp(QMainWindow):
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
 
-        # Matplotlib canvas
-        self.figure = Figure(figsize=(8, 4))
-        self.canvas = FigureCanvas(self.figure)
-        self.toolbar = NavigationToolbar(self.canvas, self)
+        # Plot widget, zoom and pan with the mouse
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
+        # Only curves with a name show up in the legend
+        self.plot_widget.addLegend()
 
-        main_layout.addWidget(self.toolbar)
-        main_layout.addWidget(self.canvas)
+        main_layout.addWidget(self.plot_widget)
 
         # Bottom section with buttons and console
         bottom_layout = QHBoxLayout()
@@ -157,7 +256,17 @@ class BasicQtApp(QMainWindow):
         self.console = QTextEdit()
         self.console.setReadOnly(True)
         self.console.setPlaceholderText("Console output...")
+        # Drop the oldest lines instead of growing the document forever
+        self.console.document().setMaximumBlockCount(2000)
         console_layout.addWidget(self.console)
+        # Separate cursor for writing, leaves the user's selection alone
+        self.log_cursor = QTextCursor(self.console.document())
+
+        # Console messages are collected and appended at most every 33 ms
+        self.log_pending = []
+        self.log_timer = QTimer(self)
+        self.log_timer.setSingleShot(True)
+        self.log_timer.timeout.connect(self.flush_log)
 
         # Add to bottom layout
         bottom_layout.addLayout(button_layout, 1)
@@ -181,28 +290,49 @@ class BasicQtApp(QMainWindow):
     def refresh_ports(self):
         """Refresh available COM ports"""
         self.port_combo.clear()
-        ports = serial.tools.list_ports.comports()
+        ports = QSerialPortInfo.availablePorts()
         for port in ports:
-            self.port_combo.addItem(f"{port.device} - {port.description}", port.device)
+            self.port_combo.addItem(f"{port.portName()} - {port.description()}", port.portName())
 
         if self.port_combo.count() == 0:
             self.port_combo.addItem("No ports found")
 
     def log_to_console(self, message):
         """Helper method to log messages to console"""
-        self.console.append(message)
+        self.log_pending.append(message)
+        if not self.log_timer.isActive():
+            self.log_timer.start(33)
+
+    def flush_log(self):
+        """Insert all pending messages at the end of the console in one go"""
+        if not self.log_pending:
+            return
+
+        text = '\n'.join(self.log_pending)
+        self.log_pending.clear()
+        if not self.console.document().isEmpty():
+            text = '\n' + text
+
+        # Only follow the output if the console was scrolled to the bottom
+        scrollbar = self.console.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+
+        self.log_cursor.movePosition(QTextCursor.End)
+        self.log_cursor.insertText(text)
+
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
 
     def send_command(self):
         """Send command from input field to the serial port"""
         command = self.command_input.text()
-        if command and self.serial_port and self.serial_port.is_open:
+        if command and self.serial_port and self.serial_port.isOpen():
             self.log_to_console(f"> {command}")
-            try:
-                self.serial_port.write(f"{command}\n".encode('utf-8'))
+            if self.serial_port.write(f"{command}\n".encode('utf-8')) == -1:
+                self.log_to_console(f"Error sending command: {self.serial_port.errorString()}")
+            else:
                 self.command_input.clear()
-            except Exception as e:
-                self.log_to_console(f"Error sending command: {str(e)}")
-        elif not self.serial_port or not self.serial_port.is_open:
+        elif not self.serial_port or not self.serial_port.isOpen():
             self.log_to_console("Error: Serial port not open. Please connect first.")
 
     def on_connect_clicked(self):
@@ -211,197 +341,226 @@ class BasicQtApp(QMainWindow):
             self.log_to_console("Error: No COM port selected")
             return
 
+        if self.serial_port and self.serial_port.isOpen():
+            self.log_to_console("Error: Already connected. Please disconnect first.")
+            return
+
         port_name = self.port_combo.currentData()
         baud_rate = int(self.baud_combo.currentText())
 
-        try:
-            self.log_to_console(f"Connecting to {port_name} at {baud_rate} baud...")
-
-            # Open serial port
-            self.serial_port = serial.Serial(
-                port=port_name,
-                baudrate=baud_rate,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                timeout=1
-            )
-
-            # Start reader thread
-            self.reader_thread = SerialReaderThread(self.serial_port)
-            self.reader_thread.data_received.connect(self.handle_serial_data)
-            self.reader_thread.start()
-
-            self.log_to_console(f"Connected successfully to {port_name}")
+        self.log_to_console(f"Connecting to {port_name} at {baud_rate} baud...")
+
+        # Open serial port, received data is signalled by the Qt event loop
+        port = QSerialPort(port_name, self)
+        port.setBaudRate(baud_rate)
+        port.setDataBits(QSerialPort.Data8)
+        port.setParity(QSerialPort.NoParity)
+        port.setStopBits(QSerialPort.OneStop)
+        port.setFlowControl(QSerialPort.NoFlowControl)
+        if not port.open(QSerialPort.ReadWrite):
+            self.log_to_console(f"Error connecting: {port.errorString()}")
+            port.deleteLater()
+            return
+        port.readyRead.connect(self.on_ready_read)
+        port.errorOccurred.connect(self.on_serial_error)
+        self.serial_port = port
 
-        except Exception as e:
-            self.log_to_console(f"Error connecting: {str(e)}")
-            if self.serial_port:
-                self.serial_port.close()
-                self.serial_port = None
+        self.log_to_console(f"Connected successfully to {port_name}")
 
     def on_disconnect_clicked(self):
         """Handle disconnect button click"""
-        if self.serial_port and self.serial_port.is_open:
+        if self.serial_port and self.serial_port.isOpen():
             self.log_to_console("Disconnecting from serial port...")
 
-            # Stop any active reading operations
+            # Stop any active reading or writing operations
             self.reading_mode = False
-            if self.response_timeout_timer:
-                self.response_timeout_timer.stop()
-                self.response_timeout_timer = None
-
-            # Stop reader thread
-            if self.reader_thread:
-                self.reader_thread.stop()
-                self.reader_thread.wait()
-                self.reader_thread = None
+            self.response_timeout_timer.stop()
+            self.stop_writing()
 
             # Close serial port
             self.serial_port.close()
+            self.serial_port.deleteLater()
             self.serial_port = None
 
             self.log_to_console("Disconnected successfully")
         else:
             self.log_to_console("No active connection to disconnect")
 
-    def handle_serial_data(self, text):
-        """Handle data received from serial port"""
-        self.console.append(text)
-
-        # Parse read responses if in reading mode
-        if self.reading_mode and self.waiting_for_response:
-            # Accumulate text in response buffer
-            self.response_buffer += text
-            self.parse_read_response()
+    def on_ready_read(self):
+        """Read all complete lines received on the serial port"""
+        # The port emitting the signal, self.serial_port may already be gone
+        port = self.sender()
+        lines = []
+        while port.canReadLine():
+            line = bytes(port.readLine()).decode('utf-8', errors='ignore')
+            lines.append(line.rstrip('\r\n'))
+        if lines:
+            self.handle_serial_data(lines)
+
+    def on_serial_error(self, error):
+        """Handle errors reported by the serial port"""
+        if error != QSerialPort.NoError:
+            self.log_to_console(f"Serial port error: {self.sender().errorString()}")
+
+    def handle_serial_data(self, lines):
+        """Handle complete lines received from serial port"""
+        # Parse read responses or set acknowledgements while reading or writing,
+        # the echoed commands and responses are not shown, both end with a
+        # summary instead. Any other device output is still logged.
+        if self.reading_mode:
+            self.parse_read_response(lines)
+        elif self.writing_mode:
+            self.parse_set_response(lines)
+        else:
+            self.log_to_console('\n'.join(lines))
 
     def on_read_clicked(self):
         """Handle read button click"""
-        self.log_to_console("Reading from all 64 addresses...")
+        self.log_to_console(f"Reading from all {NUM_REGS} addresses...")
 
-        if not self.serial_port or not self.serial_port.is_open:
+        if not self.serial_port or not self.serial_port.isOpen():
             self.log_to_console("Error: Serial port not open. Please connect first.")
             return
 
+        if self.design_worker or self.writing_mode:
+            self.log_to_console("Error: still writing coefficients.")
+            return
+
         # Clear previous values and start reading
-        self.read_values = []
-        self.current_address = 0
+        self.read_values[:] = 0
+        self.read_pending[:] = True
+        self.remaining = NUM_REGS
         self.reading_mode = True
-        self.response_buffer = ""
         self.retry_count = 0
 
-        # Send first read command
-        self.send_read_command()
-
-    def send_read_command(self):
-        """Send read command for current address"""
-        if self.current_address < 64:
-            command = f"R{self.current_address}"
-            try:
-                # Clear the response buffer before sending command
-                self.response_buffer = ""
-
-                self.serial_port.write(f"{command}\n".encode('utf-8'))
-                self.log_to_console(f"> {command}")
-                self.waiting_for_response = True
-
-                # Start timeout timer (1000ms timeout)
-                if self.response_timeout_timer:
-                    self.response_timeout_timer.stop()
-                self.response_timeout_timer = QTimer()
-                self.response_timeout_timer.setSingleShot(True)
-                self.response_timeout_timer.timeout.connect(self.handle_response_timeout)
-                self.response_timeout_timer.start(1000)
-
-            except Exception as e:
-                self.log_to_console(f"Error sending read command: {str(e)}")
-                self.reading_mode = False
-        else:
-            # All addresses read, plot the results
+        # Read commands are sent as responses arrive, responses are collected by address
+        self.send_read_commands()
+
+    def send_read_commands(self):
+        """Queue read commands for all addresses not yet received"""
+        self.read_queue = deque(np.flatnonzero(self.read_pending).tolist())
+        self.reads_in_flight = 0
+        self.log_to_console(f"> {self.remaining} read commands")
+        self.send_next_reads()
+
+    def send_next_reads(self):
+        """Send queued read commands until MAX_IN_FLIGHT are awaiting a response"""
+        count = min(MAX_IN_FLIGHT - self.reads_in_flight, len(self.read_queue))
+        if count <= 0:
+            return
+
+        payload = b"".join(_READ_CMDS[self.read_queue.popleft()] for _ in range(count))
+        if self.serial_port.write(payload) == -1:
+            self.log_to_console(f"Error sending read command: {self.serial_port.errorString()}")
             self.reading_mode = False
-            self.log_to_console(f"All 64 addresses read successfully ({len(self.read_values)} values collected)")
-            self.plot_read_values()
+            self.response_timeout_timer.stop()
+            return
+        self.reads_in_flight += count
+
+        # Start timeout timer (1000ms without any response)
+        self.response_timeout_timer.start(1000)
+
+    def finish_reading(self):
+        """Read sweep done, plot the results"""
+        self.reading_mode = False
+        self.response_timeout_timer.stop()
+        skipped = self.remaining
+        if skipped:
+            self.log_to_console(f"Read incomplete: {NUM_REGS - skipped} of {NUM_REGS} values collected, "
+                                f"{skipped} addresses set to 0")
+        else:
+            self.log_to_console(f"All {NUM_REGS} addresses read successfully ({NUM_REGS} values collected)")
+        self.plot_read_values()
 
     def handle_response_timeout(self):
-        """Handle timeout when waiting for read response"""
-        if self.waiting_for_response and self.reading_mode:
-            self.retry_count += 1
-            if self.retry_count <= self.max_retries:
-                self.log_to_console(f"Timeout waiting for address {self.current_address} (retry {self.retry_count}/{self.max_retries})")
-                self.waiting_for_response = False
-                # Retry the same command
-                QTimer.singleShot(50, self.send_read_command)
-            else:
-                # Max retries reached, skip this address and continue
-                self.log_to_console(f"Error: Max retries reached for address {self.current_address}, skipping...")
-                self.read_values.append(0)  # Add placeholder value
-                self.current_address += 1
-                self.retry_count = 0
-                self.waiting_for_response = False
-                QTimer.singleShot(50, self.send_read_command)
-
-    def parse_read_response(self):
-        """Parse response from read commands using accumulated buffer"""
-        # Response format: "Read reg[addr] = value"
-        import re
-
-        # Look for pattern in the accumulated buffer
-        match = re.search(r'Read reg\[(\d+)\]\s*=\s*(-?\d+)', self.response_buffer)
-        if match:
+        """Handle timeout when waiting for read responses"""
+        if not self.reading_mode:
+            return
+
+        self.retry_count += 1
+        if self.retry_count <= self.max_retries:
+            self.log_to_console(f"Timeout waiting for {self.remaining} addresses (retry {self.retry_count}/{self.max_retries})")
+            # Request the remaining addresses again
+            self.send_read_commands()
+        else:
+            # Max retries reached, fill missing addresses with placeholders
+            self.log_to_console(f"Error: Max retries reached, skipping {self.remaining} addresses...")
+            self.read_values[self.read_pending] = 0
+            self.finish_reading()
+
+    def parse_read_response(self, lines):
+        """Parse responses from read commands in complete received lines"""
+        received = False
+        for i, line in enumerate(lines):
+            match = _READ_RE.fullmatch(line)
+            if not match:
+                # Only the echoed read commands are hidden, errors are shown
+                if not _READ_ECHO_RE.fullmatch(line):
+                    self.log_to_console(line)
+                continue
+            received = True
+            self.reads_in_flight = max(0, self.reads_in_flight - 1)
             addr = int(match.group(1))
             value = int(match.group(2))
 
-            # Verify it's the address we expected
-            if addr == self.current_address:
-                # Stop timeout timer
-                if self.response_timeout_timer:
-                    self.response_timeout_timer.stop()
-
-                self.read_values.append(value)
+            # Responses may arrive in any order, ignore duplicates from retries
+            if addr < NUM_REGS and self.read_pending[addr]:
+                self.read_values[addr] = value
                 # Don't log each value to avoid console spam
                 # self.log_to_console(f"Address {addr}: {value}")
 
-                # Move to next address
-                self.current_address += 1
+                self.read_pending[addr] = False
+                self.remaining -= 1
                 self.retry_count = 0  # Reset retry count on success
-                self.waiting_for_response = False
 
-                # Send next command after brief delay (50ms for better reliability)
-                QTimer.singleShot(50, self.send_read_command)
-            else:
-                self.log_to_console(f"Warning: Received address {addr}, expected {self.current_address}")
+                if self.remaining == 0:
+                    self.finish_reading()
+                    # Lines after the last response are not part of the read
+                    rest = lines[i + 1:]
+                    if rest:
+                        self.log_to_console('\n'.join(rest))
+                    return
+
+        if received:
+            # Still receiving, send the next reads and restart the timeout
+            self.response_timeout_timer.start(1000)
+            self.send_next_reads()
+
+    def setup_read_plot(self):
+        """Show the register plot with a persistent curve"""
+        self.plot_widget.clear()
+        self.plot_widget.setTitle(f'Register Values (Addresses 0-{NUM_REGS - 1})')
+        self.plot_widget.setLabel('bottom', 'Address')
+        self.plot_widget.setLabel('left', 'Value')
+        self.plot_widget.setXRange(-1, NUM_REGS, padding=0)
+        self.plot_widget.enableAutoRange(axis='y')
+
+        self.read_curve = self.plot_widget.plot(pen=pg.mkPen('b', width=1.5), symbol='o',
+                                                symbolSize=4, symbolPen='b', symbolBrush='b')
 
     def plot_read_values(self):
-        """Plot the values read from all 64 addresses"""
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-
-        # Create address array (0-63)
-        addresses = np.arange(64)
-        values = np.array(self.read_values[:64])
-
-        # Plot the data
-        ax.plot(addresses, values, 'b-', marker='o', markersize=4, linewidth=1.5)
-        ax.set_xlabel('Address')
-        ax.set_ylabel('Value')
-        ax.set_title('Register Values (Addresses 0-63)')
-        ax.grid(True, alpha=0.3)
-
-        # Optionally add value labels on hover or at specific points
-        ax.set_xlim(-1, 64)
-
-        # Refresh canvas
-        self.canvas.draw()
+        """Plot the values read from all addresses"""
+        # Curve is gone if another plot replaced it
+        if self.read_curve not in self.plot_widget.listDataItems():
+            self.setup_read_plot()
+            self.read_plot_values = None
+
+        # Only redraw if the values changed, the curve keeps its own copy since
+        # read_values is overwritten by the next read
+        values = self.read_values
+        if self.read_plot_values is None or not np.array_equal(values, self.read_plot_values):
+            self.read_plot_values = values.copy()
+            self.read_curve.setData(_ADDR_X, self.read_plot_values)
+        v_min = int(values.min())
+        v_max = int(values.max())
+        v_mean = float(values.mean())
 
         self.log_to_console(f"Plot updated with {len(values)} values")
-        self.log_to_console(f"Min: {np.min(values)}, Max: {np.max(values)}, Mean: {np.mean(values):.2f}")
+        self.log_to_console(f"Min: {v_min}, Max: {v_max}, Mean: {v_mean:.2f}")
 
     def plot_example(self):
         """Plot an example graph"""
-        self.figure.clear()
-
-        # Create a subplot
-        ax = self.figure.add_subplot(111)
+        self.plot_widget.clear()
 
         # Generate sample data
         t = np.linspace(0, 2 * np.pi, 1000)
@@ -409,39 +568,34 @@ class BasicQtApp(QMainWindow):
         y2 = np.cos(2 * np.pi * 3 * t)
 
         # Plot the data
-        ax.plot(t, y1, label='sin(10πt)')
-        ax.plot(t, y2, label='cos(6πt)')
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Amplitude')
-        ax.set_title('Example Plot')
-        ax.legend()
-        ax.grid(True)
-
-        # Refresh canvas
-        self.canvas.draw()
+        self.plot_widget.plot(t, y1, pen='b', name='sin(10πt)')
+        self.plot_widget.plot(t, y2, pen='r', name='cos(6πt)')
+        self.plot_widget.setLabel('bottom', 'Time (s)')
+        self.plot_widget.setLabel('left', 'Amplitude')
+        self.plot_widget.setTitle('Example Plot')
+        self.plot_widget.enableAutoRange()
 
         self.log_to_console("Plot updated")
 
     def closeEvent(self, event):
         """Handle window close event"""
-        # Stop any active reading operations
+        # Stop any active reading or writing operations
         self.reading_mode = False
-        if self.response_timeout_timer:
-            self.response_timeout_timer.stop()
-            self.response_timeout_timer = None
+        self.response_timeout_timer.stop()
+        self.stop_writing()
 
-        # Clean up serial connection
-        if self.reader_thread:
-            self.reader_thread.stop()
-            self.reader_thread.wait()
+        # Let a running FIR design finish
+        if self.design_worker:
+            self.design_worker.wait()
 
-        if self.serial_port and self.serial_port.is_open:
+        # Clean up serial connection
+        if self.serial_port and self.serial_port.isOpen():
             self.serial_port.close()
 
         event.accept()
         
     def on_compute_and_write_clicked(self):
-        if not self.serial_port or not self.serial_port.is_open:
+        if not self.serial_port or not self.serial_port.isOpen():
             self.log_to_console("Error: Serial port not open.")
             return
 
@@ -461,68 +615,120 @@ class BasicQtApp(QMainWindow):
             return
 
         ftype = self.type_combo.currentText()
-        fs = 48000.0
-        taps = 64
-        nyq = fs / 2.0
 
         # Basic sanity
-        if any(f <= 0 or f >= nyq for f in c):
-            self.log_to_console(f"Error: cutoff must be in (0, {nyq} Hz).")
+        if any(f <= 0 or f >= NYQ for f in c):
+            self.log_to_console(f"Error: cutoff must be in (0, {NYQ} Hz).")
             return
 
-        if ftype in ["bp", "bs"] and len(c) != 2:
+        if ftype in BP_BS and len(c) != 2:
             self.log_to_console("Error: band-pass/stop requires two cutoff frequencies (f_low,f_high).")
             return
 
-        # ---- FIR design with odd-tap fix for hp / bs ----
-        internal_taps = taps
-        if ftype in ["hp", "bs"] and (taps % 2 == 0):
-            internal_taps = taps + 1  # make it odd for SciPy
-
-        # Normalize cutoffs
-        if ftype in ["lp", "hp"]:
-            norm = c[0] / nyq
-            # keep strictly inside (0,1)
-            norm = max(1e-6, min(norm, 0.999999))
-            coeff = firwin(internal_taps, norm, pass_zero=(ftype == "lp"))
+        if self.design_worker or self.writing_mode:
+            self.log_to_console("Error: still computing or writing the previous coefficients.")
+            return
 
-        else:  # bp / bs
-            norm = [f / nyq for f in c]
-            norm = [max(1e-6, min(v, 0.999999)) for v in norm]
-            coeff = firwin(internal_taps, norm, pass_zero=(ftype == "bs"))
+        if self.reading_mode:
+            self.log_to_console("Error: still reading registers.")
+            return
 
-        # Trim back to 64 taps if we increased it
-        if internal_taps != taps:
-            center = internal_taps // 2
-            coeff = np.delete(coeff, center)
+        # Design runs in a worker thread, the result is written in on_fir_designed
+        self.log_to_console(f"Computing {TAPS} FIR coefficients (type={ftype}, cutoff={text} Hz)...")
+        self.design_worker = FirDesignWorker(c, ftype, self.quant_buf, self.fixed_buf)
+        self.design_worker.designed.connect(self.on_fir_designed)
+        self.design_worker.failed.connect(self.on_fir_design_failed)
+        self.design_worker.finished.connect(self.on_fir_worker_finished)
+        self.design_worker.start()
+
+    def on_fir_designed(self, payload):
+        """Write the computed FIR coefficients to the serial port"""
+        if not self.serial_port or not self.serial_port.isOpen():
+            self.log_to_console("Error: Serial port not open.")
+            return
 
-        # Scale to Q1.15
-        scale = 2**15
-        fixed = np.round(coeff * scale)
-        fixed = np.clip(fixed, -32768, 32767).astype(np.int16)
+        # Set commands are sent as acknowledgements arrive
+        self.write_queue = deque(payload.splitlines(keepends=True))
+        self.writes_in_flight = 0
+        self.writing_mode = True
+        self.send_next_writes()
 
-        self.log_to_console("Writing computed FIR coefficients...")
+    def send_next_writes(self):
+        """Send queued set commands until MAX_IN_FLIGHT are awaiting an acknowledgement"""
+        count = min(MAX_IN_FLIGHT - self.writes_in_flight, len(self.write_queue))
+        if count <= 0:
+            return
 
-        for addr, val in enumerate(fixed):
-            cmd = f"S{addr}${int(val)}"
-            try:
-                self.serial_port.write((cmd + "\n").encode())
-                self.log_to_console(f"> {cmd}")
-            except Exception as e:
-                self.log_to_console(f"Error sending {cmd}: {e}")
-                break
+        payload = b"".join(self.write_queue.popleft() for _ in range(count))
+        if self.serial_port.write(payload) == -1:
+            self.log_to_console(f"Error sending coefficients: {self.serial_port.errorString()}")
+            self.stop_writing()
+            return
+        self.writes_in_flight += count
+
+        if self.verbose:
+            self.log_to_console('\n'.join(f"> {cmd}" for cmd in payload.decode('ascii').splitlines()))
+
+        # Start timeout timer (1000ms without any acknowledgement)
+        self.write_timeout_timer.start(1000)
+
+    def parse_set_response(self, lines):
+        """Count acknowledgements of set commands in complete received lines"""
+        acked = False
+        for i, line in enumerate(lines):
+            if not _SET_RE.fullmatch(line):
+                # Only the echoed set commands are hidden, errors are shown
+                if not _SET_ECHO_RE.fullmatch(line):
+                    self.log_to_console(line)
+                continue
+            acked = True
+            self.writes_in_flight = max(0, self.writes_in_flight - 1)
+
+            if not self.write_queue and self.writes_in_flight == 0:
+                self.stop_writing()
+                self.log_to_console(f"Done writing {TAPS} coefficients.")
+                # Lines after the last acknowledgement are not part of the write
+                rest = lines[i + 1:]
+                if rest:
+                    self.log_to_console('\n'.join(rest))
+                return
+
+        if acked:
+            # Still writing, restart the timeout and send the next commands
+            self.write_timeout_timer.start(1000)
+            self.send_next_writes()
+
+    def handle_write_timeout(self):
+        """Handle timeout when waiting for set acknowledgements"""
+        if not self.writing_mode:
+            return
 
-        self.log_to_console("Done writing coefficients.")
+        # Commands sent without acknowledgement may or may not have been written
+        unconfirmed = len(self.write_queue) + self.writes_in_flight
+        self.log_to_console(f"Error: timeout waiting for acknowledgements, "
+                            f"{unconfirmed} of {TAPS} coefficients not confirmed.")
+        self.stop_writing()
 
-        
-        
-        
+    def stop_writing(self):
+        """End writing coefficients, drops commands not sent yet"""
+        self.writing_mode = False
+        self.write_queue.clear()
+        self.writes_in_flight = 0
+        self.write_timeout_timer.stop()
 
+    def on_fir_design_failed(self, message):
+        """Handle an error in the FIR design"""
+        self.log_to_console(f"Error computing coefficients: {message}")
 
+    def on_fir_worker_finished(self):
+        """Allow the next FIR design once the worker is done"""
+        self.design_worker.deleteLater()
+        self.design_worker = None
 
 
 def main():
     app = QApplication(sys.argv)
+    pg.setConfigOptions(background='w', foreground='k')
     window = BasicQtApp()
     window.show()
     sys.exit(app.exec())
@@ -7,11 +7,20 @@ This script automates the following workflow:
 2. Builds the NIOS2 application program
 3. Generates the mem_init files (.hex)
 4. Updates the SOPC/Qsys file with new memory initialization
+
+Steps whose outputs are newer than their inputs are skipped, pass --force
+to run them anyway. The BSP and application are only cleaned with --force,
+a clean would make every step out of date.
 """
 
 import os
+import re
 import sys
+import glob
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 # ============================================================================
@@ -28,50 +37,66 @@ BSP_DIR = "fir_uart_nios_bsp"
 APP_DIR = "fir_uart_nios"
 
 # Build options
-SKIP_CLEAN = False          # Set to True to skip clean step (faster rebuild)
+SKIP_CLEAN = False          # Set to True to skip clean step even with --force (faster rebuild)
 SKIP_BSP_BUILD = False      # Set to True to skip BSP build (only build app)
 SKIP_SOPC_UPDATE = False    # Set to True to skip SOPC update step
+FORCE_REBUILD = False       # Set to True (or pass --force) to run steps even if outputs are up to date
 
 # ============================================================================
 
 
-def run_command(cmd, cwd=None, shell=True):
-    """Execute a command and handle errors"""
+@lru_cache(maxsize=None)
+def find_executable(name):
+    """Resolve a tool to its absolute path, looked up once per tool"""
+    return shutil.which(name) or name
+
+
+def run_command(cmd, cwd=None):
+    """Execute a command (argument list, no shell) and handle errors"""
+    cmd = [find_executable(cmd[0])] + list(cmd[1:])
+
     print(f"\n{'='*60}")
-    print(f"Running: {cmd}")
+    print(f"Running: {subprocess.list2cmdline(cmd)}")
     print(f"Working directory: {cwd or os.getcwd()}")
     print(f"{'='*60}")
 
     try:
-        result = subprocess.run(
+        # Stream the output line by line instead of collecting it until the end
+        with subprocess.Popen(
             cmd,
             cwd=cwd,
-            shell=shell,
-            check=True,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        print(result.stdout)
-        if result.stderr:
-            print(f"STDERR: {result.stderr}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"ERROR: Command failed with exit code {e.returncode}")
-        print(f"STDOUT: {e.stdout}")
-        print(f"STDERR: {e.stderr}")
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1
+        ) as proc:
+            for line in proc.stdout:
+                print(line, end='')
+            returncode = proc.wait()
+    except OSError as e:
+        # Without a shell a missing tool raises instead of failing with an exit code
+        print(f"ERROR: Could not run command: {e}")
         return False
 
+    if returncode != 0:
+        print(f"ERROR: Command failed with exit code {returncode}")
+        return False
+    return True
+
+
+def version_key(path):
+    """Sort key for the version directory of a nios2eds path, e.g. 22.1std > 21.1"""
+    version = Path(path).parent.name
+    return tuple(int(n) for n in re.findall(r'\d+', version))
+
 
 def find_nios2eds():
     """Find NIOS2 EDS installation path"""
-    # Common installation paths
+    # Installations of all Quartus versions, newest version first
+    installed = sorted(glob.glob(r"C:\intelFPGA*\*\nios2eds"), key=version_key, reverse=True)
     possible_paths = [
         os.environ.get('SOPC_KIT_NIOS2'),
-        r"C:\intelFPGA_lite\20.1\nios2eds",
-        r"C:\intelFPGA\20.1\nios2eds",
-        r"C:\intelFPGA_lite\21.1\nios2eds",
-        r"C:\intelFPGA\21.1\nios2eds",
+        *installed,
         r"C:\altera\nios2eds",
     ]
 
@@ -102,30 +127,72 @@ def setup_nios2_environment():
         print(f"SOPC_KIT_NIOS2={nios2eds_path}")
 
 
+def newest_mtime(root, exts):
+    """Newest modification time of the files below root with one of the given suffixes"""
+    return max((p.stat().st_mtime for p in Path(root).rglob('*') if p.suffix in exts), default=0.0)
+
+
+def oldest_mtime(root, exts):
+    """Oldest modification time of the files below root with one of the given suffixes, None if there are none"""
+    return min((p.stat().st_mtime for p in Path(root).rglob('*') if p.suffix in exts), default=None)
+
+
+def mtime_or_none(path):
+    """Modification time of path from a single stat() call, None if it does not exist"""
+    try:
+        return Path(path).stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def sopcinfo_changed(sopcinfo_file, bsp_dir, sopcinfo_stamp):
+    """Check if the sopcinfo is newer than the BSP generated from it, i.e. the hardware changed in Qsys"""
+    # qsys-generate in the SOPC step rewrites the sopcinfo as well, sopcinfo_stamp
+    # marks that rewrite so it does not count as a hardware change
+    bsp_synced = max(mtime_or_none(Path(bsp_dir) / "system.h") or 0.0, mtime_or_none(sopcinfo_stamp) or 0.0)
+    return (mtime_or_none(sopcinfo_file) or 0.0) > bsp_synced
+
+
+def is_up_to_date(output, newest_input, force=False):
+    """Check if a step's output exists and is newer than all of its inputs"""
+    if force:
+        return False
+    output_mtime = mtime_or_none(output)
+    if output_mtime is None or output_mtime < newest_input:
+        return False
+    print(f"Up to date, skipping (use --force to rebuild): {output}")
+    return True
+
+
 def clean_bsp(bsp_dir):
     """Clean the BSP directory"""
     print(f"\n{'*'*60}")
     print("STEP: Cleaning BSP")
     print(f"{'*'*60}")
 
-    return run_command("make clean", cwd=bsp_dir)
+    return run_command(["make", "clean"], cwd=bsp_dir)
 
 
-def build_bsp(bsp_dir):
+def build_bsp(bsp_dir, settings_bsp, sopcinfo_file, sopcinfo_stamp, force=False):
     """Build the NIOS2 BSP"""
     print(f"\n{'*'*60}")
     print("STEP: Building BSP")
     print(f"{'*'*60}")
 
+    # A hardware change in Qsys (base addresses, IRQs) has to regenerate system.h
+    hw_changed = sopcinfo_changed(sopcinfo_file, bsp_dir, sopcinfo_stamp)
+    bsp_lib = Path(bsp_dir) / "libhal_bsp.a"
+    if not hw_changed and is_up_to_date(bsp_lib, newest_mtime(bsp_dir, {'.c', '.h', '.S', '.bsp', '.mk'}), force):
+        return True
+
     # First, try to generate/update the BSP using nios2-bsp if settings.bsp exists
-    settings_bsp = os.path.join(bsp_dir, "settings.bsp")
-    if os.path.exists(settings_bsp):
+    if mtime_or_none(settings_bsp) is not None:
         print(f"Regenerating BSP from {settings_bsp}")
         # This ensures the BSP is up to date with the SOPC file
-        run_command(f"nios2-bsp-generate-files --bsp-dir {bsp_dir} --settings {settings_bsp}")
+        run_command(["nios2-bsp-generate-files", "--bsp-dir", bsp_dir, "--settings", str(settings_bsp)])
 
     # Build the BSP
-    return run_command("make", cwd=bsp_dir)
+    return run_command(["make"], cwd=bsp_dir)
 
 
 def clean_app(app_dir):
@@ -134,63 +201,91 @@ def clean_app(app_dir):
     print("STEP: Cleaning Application")
     print(f"{'*'*60}")
 
-    return run_command("make clean", cwd=app_dir)
+    return run_command(["make", "clean"], cwd=app_dir)
 
 
-def build_app(app_dir):
+def build_app(app_dir, bsp_dir, elf_file, force=False):
     """Build the NIOS2 application"""
     print(f"\n{'*'*60}")
     print("STEP: Building Application")
     print(f"{'*'*60}")
 
-    return run_command("make", cwd=app_dir)
+    # The application also has to be relinked when the BSP library changed
+    newest_input = max(newest_mtime(app_dir, {'.c', '.h', '.S'}), newest_mtime(bsp_dir, {'.a'}))
+    if is_up_to_date(elf_file, newest_input, force):
+        return True
+
+    return run_command(["make"], cwd=app_dir)
 
 
-def generate_mem_init(app_dir, bsp_dir):
+def generate_mem_init(app_dir, bsp_dir, elf_file, force=False):
     """Generate memory initialization files (.hex)"""
     print(f"\n{'*'*60}")
     print("STEP: Generating Memory Initialization Files")
     print(f"{'*'*60}")
 
     # The mem_init_generate command creates .hex files from the .elf
-    elf_file = os.path.join(app_dir, os.path.basename(app_dir) + ".elf")
-
-    if not os.path.exists(elf_file):
+    elf_mtime = mtime_or_none(elf_file)
+    if elf_mtime is None:
         print(f"ERROR: ELF file not found: {elf_file}")
         return False
 
     print(f"Using ELF file: {elf_file}")
 
+    # Skip if every .hex file is newer than the ELF file, an older one was not
+    # regenerated for the current ELF (e.g. nios2-elf-mem-init-generate failed)
+    hex_mtime = oldest_mtime(app_dir, {'.hex'})
+    if not force and hex_mtime is not None and hex_mtime >= elf_mtime:
+        print("Up to date, skipping (use --force to rebuild): memory initialization files")
+        return True
+
     # Generate mem_init files
     # This will create .hex files in the application directory
-    cmd = f"elf2hex {elf_file} --base=0x00000000 --end=0x00007FFF --width=32 --little-endian-lanes --create-lanes=0,1,2,3"
+    cmd = ["elf2hex", str(elf_file), "--base=0x00000000", "--end=0x00007FFF", "--width=32",
+           "--little-endian-lanes", "--create-lanes=0,1,2,3"]
     success = run_command(cmd, cwd=app_dir)
 
     if success:
         # Also try using mem_init_generate if available (creates files in specific format)
-        mem_init_cmd = f"nios2-elf-mem-init-generate --infile={elf_file}"
+        mem_init_cmd = ["nios2-elf-mem-init-generate", f"--infile={elf_file}"]
         run_command(mem_init_cmd, cwd=app_dir)
 
     return success
 
 
-def update_sopc_memory(sopc_file):
+def update_sopc_memory(sopc_file, app_dir, bsp_dir, sopcinfo_stamp, force=False):
     """Update SOPC/Qsys file with new memory initialization"""
     print(f"\n{'*'*60}")
     print("STEP: Updating SOPC/Qsys Memory Initialization")
     print(f"{'*'*60}")
 
-    if not os.path.exists(sopc_file):
+    sopc_mtime = mtime_or_none(sopc_file)
+    if sopc_mtime is None:
         print(f"ERROR: SOPC file not found: {sopc_file}")
         return False
 
     print(f"SOPC file: {sopc_file}")
 
+    # qsys-generate writes to <qsys dir>/<qsys name>/synthesis
+    synthesis_dir = sopc_file.with_suffix('') / "synthesis"
+    newest_input = max(sopc_mtime, newest_mtime(app_dir, {'.hex'}))
+    if not force and synthesis_dir.is_dir() and newest_mtime(synthesis_dir, {'.v'}) >= newest_input:
+        print(f"Up to date, skipping (use --force to rebuild): {synthesis_dir}")
+        return True
+
     # Use qsys-generate to update the memory initialization
     # This command updates the Qsys system with new mem init files
-    cmd = f"qsys-generate {sopc_file} --synthesis=VERILOG"
+    cmd = ["qsys-generate", str(sopc_file), "--synthesis=VERILOG"]
+    sopcinfo_file = sopc_file.with_suffix('.sopcinfo')
+    bsp_in_sync = not sopcinfo_changed(sopcinfo_file, bsp_dir, sopcinfo_stamp)
+    if not run_command(cmd, cwd=sopc_file.parent):
+        return False
 
-    return run_command(cmd, cwd=os.path.dirname(sopc_file))
+    # The sopcinfo was only regenerated for the new memory contents, unless
+    # the BSP was already behind a hardware change
+    if bsp_in_sync:
+        sopcinfo_stamp.touch()
+    return True
 
 
 def main():
@@ -222,6 +317,15 @@ def main():
         print(f"ERROR: Application directory not found: {app_dir}")
         sys.exit(1)
 
+    force = FORCE_REBUILD or "--force" in sys.argv[1:]
+
+    # Files used by several steps, resolved once
+    settings_bsp = Path(bsp_dir) / "settings.bsp"
+    elf_file = Path(app_dir) / (os.path.basename(app_dir) + ".elf")
+    sopc_path = Path(sopc_file)
+    sopcinfo_file = sopc_path.with_suffix('.sopcinfo')
+    sopcinfo_stamp = Path(bsp_dir) / ".sopcinfo_stamp"
+
     # Setup NIOS2 EDS environment
     setup_nios2_environment()
 
@@ -230,15 +334,24 @@ def main():
     steps_failed = []
 
     try:
-        # Step 1: Clean and build BSP
-        if not SKIP_BSP_BUILD:
-            if not SKIP_CLEAN:
-                if clean_bsp(bsp_dir):
-                    steps_passed.append("Clean BSP")
+        # Step 1: Clean BSP and application, independent of each other so run in parallel.
+        # Only when rebuilding everything, otherwise up to date steps are skipped
+        if force and not SKIP_CLEAN:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                clean_jobs = {}
+                if not SKIP_BSP_BUILD:
+                    clean_jobs["Clean BSP"] = executor.submit(clean_bsp, bsp_dir)
+                clean_jobs["Clean Application"] = executor.submit(clean_app, app_dir)
+
+            for step, job in clean_jobs.items():
+                if job.result():
+                    steps_passed.append(step)
                 else:
-                    steps_failed.append("Clean BSP")
+                    steps_failed.append(step)
 
-            if build_bsp(bsp_dir):
+        # Step 2: Build BSP
+        if not SKIP_BSP_BUILD:
+            if build_bsp(bsp_dir, settings_bsp, sopcinfo_file, sopcinfo_stamp, force):
                 steps_passed.append("Build BSP")
             else:
                 steps_failed.append("Build BSP")
@@ -246,29 +359,23 @@ def main():
         else:
             print("\nSkipping BSP build...")
 
-        # Step 2: Clean and build application
-        if not SKIP_CLEAN:
-            if clean_app(app_dir):
-                steps_passed.append("Clean Application")
-            else:
-                steps_failed.append("Clean Application")
-
-        if build_app(app_dir):
+        # Step 3: Build application
+        if build_app(app_dir, bsp_dir, elf_file, force):
             steps_passed.append("Build Application")
         else:
             steps_failed.append("Build Application")
             raise Exception("Application build failed")
 
-        # Step 3: Generate memory initialization files
-        if generate_mem_init(app_dir, bsp_dir):
+        # Step 4: Generate memory initialization files
+        if generate_mem_init(app_dir, bsp_dir, elf_file, force):
             steps_passed.append("Generate Memory Init Files")
         else:
             steps_failed.append("Generate Memory Init Files")
             print("WARNING: Memory init file generation had issues")
 
-        # Step 4: Update SOPC file
+        # Step 5: Update SOPC file
         if not SKIP_SOPC_UPDATE:
-            if update_sopc_memory(sopc_file):
+            if update_sopc_memory(sopc_path, app_dir, bsp_dir, sopcinfo_stamp, force):
                 steps_passed.append("Update SOPC Memory")
             else:
                 steps_failed.append("Update SOPC Memory")